@@ -1,2 +1,73 @@
+"""
+filename: mbta/__init__.py
+author: Jared Stufft, jared@stufft.us
+desc: Top-level namespace for the mbta package. Public names are loaded on first attribute access, so `import mbta`
+stays cheap for short-lived jobs and network libraries are only imported once a call is made.
+"""
+
+import sys
 
 name = 'mbta'
+
+# In public name : defining module format
+_LAZY_ATTRIBUTES = {
+    'MBTAPerformanceAPI': 'mbta.performance',
+    'Response': 'mbta.response',
+    'ResponseView': 'mbta.response',
+    'MBTAPerformanceResponse': 'mbta.response',
+    'MBTAPastAlertsResponse': 'mbta.response',
+    'GTFS_CONTENT_URL': 'mbta.utils',
+    'get_gtfs_utility_data': 'mbta.utils',
+    'make_query_spec': 'mbta.batch',
+    'configure_scheduler': 'mbta.scheduler',
+    'AdaptiveWindowPlanner': 'mbta.windowing',
+    'MetricAnomalyMonitor': 'mbta.monitor',
+    'AlertIndex': 'mbta.alerts'
+}
+
+_LAZY_SUBMODULES = ('alerts', 'batch', 'export', 'monitor', 'performance', 'response', 'scheduler', 'utils',
+                    'windowing')
+
+__all__ = sorted(_LAZY_ATTRIBUTES)
+
+
+def _import(module_name):
+
+    """ _import
+
+    Imports a submodule by name. Uses the builtin import machinery, since importing importlib itself is a
+    noticeable part of a cold `import mbta`.
+
+    """
+
+    __import__(module_name)
+
+    return sys.modules[module_name]
+
+
+def __getattr__(attribute):
+
+    """ __getattr__
+
+    Imports the module defining a public name the first time the name is accessed, then caches the name on the
+    package so later accesses are plain attribute lookups.
+
+    """
+
+    if attribute in _LAZY_ATTRIBUTES:
+        value = getattr(_import(_LAZY_ATTRIBUTES[attribute]), attribute)
+
+    elif attribute in _LAZY_SUBMODULES:
+        value = _import('mbta.' + attribute)
+
+    else:
+        raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, attribute))
+
+    globals()[attribute] = value
+
+    return value
+
+
+def __dir__():
+
+    return sorted(set(globals()) | set(_LAZY_ATTRIBUTES) | set(_LAZY_SUBMODULES))
@@ -0,0 +1,288 @@
+"""
+filename: mbta/alerts.py
+author: Jared Stufft, jared@stufft.us
+desc: Flattens past alerts responses into normalized rows and indexes alert active periods by route, stop and trip
+so travel events can be matched to the alerts in effect with interval lookups.
+"""
+
+import bisect
+import collections
+import json
+import re
+
+
+# Columns of a flattened past alert row, one row per alert version, informed entity and active period.
+PAST_ALERT_COLUMNS = ('alert_id', 'version_id', 'valid_from', 'valid_to', 'cause', 'effect', 'header_text',
+                      'description_text', 'url', 'agency_id', 'route_id', 'route_type', 'trip_id', 'stop_id',
+                      'start', 'end')
+
+VERSION_FIELDS = ('version_id', 'valid_from', 'valid_to', 'cause', 'effect', 'header_text', 'description_text', 'url')
+
+ENTITY_FIELDS = ('agency_id', 'route_id', 'route_type', 'trip_id', 'stop_id')
+
+_WHITESPACE = re.compile(r'[ \t\n\r]*')
+
+
+def _iter_array_items(text, key):
+
+    """ _iter_array_items
+
+    Decodes the items of the JSON array stored under `key` one at a time, so only one item is ever held as
+    Python objects.
+
+    """
+
+    match = re.search(r'"{}"\s*:\s*\['.format(re.escape(key)), text)
+
+    if not match:
+        return
+
+    decoder = json.JSONDecoder()
+    index = _WHITESPACE.match(text, match.end()).end()
+
+    while text[index] != ']':
+
+        item, index = decoder.raw_decode(text, index)
+
+        yield item
+
+        index = _WHITESPACE.match(text, index).end()
+
+        if text[index] == ',':
+            index = _WHITESPACE.match(text, index + 1).end()
+
+
+def iter_past_alert_rows(raw_response):
+
+    """ iter_past_alert_rows
+
+    Streams flattened rows out of a raw past alerts response. Each alert is decoded on its own and expanded into one
+    row per (alert version, informed entity, active period), so the nested tree is never built for the whole
+    response.
+
+    INPUTS
+
+    @raw_response [bytes or str]: Raw JSON content from the past alerts endpoint.
+
+
+    RETURNS
+
+    @rows [generator of dicts]: Flat rows keyed by the names in PAST_ALERT_COLUMNS.
+
+    """
+
+    if isinstance(raw_response, bytes):
+        raw_response = raw_response.decode('utf-8')
+
+    for alert in _iter_array_items(raw_response, 'past_alerts'):
+
+        for version in alert.get('alert_versions') or [dict()]:
+
+            version_fields = {key: version.get(key) for key in VERSION_FIELDS}
+
+            for entity in version.get('informed_entity') or [dict()]:
+
+                entity_fields = {key: entity.get(key) for key in ENTITY_FIELDS}
+
+                for period in version.get('active_period') or [dict()]:
+
+                    yield {'alert_id': alert.get('alert_id'), **version_fields, **entity_fields,
+                           'start': period.get('start'), 'end': period.get('end')}
+
+
+def _epoch_or_none(value):
+
+    """ _epoch_or_none
+
+    Converts a raw epoch value to an int, treating missing values as None.
+
+    """
+
+    if value is None or value == '':
+        return None
+
+    return int(value)
+
+
+class AlertIndex:
+
+    """ AlertIndex
+
+    Interval index from (route_id, stop_id, trip_id) informed entities to the alerts active over time. Each entity's
+    active periods are swept once into sorted boundaries holding the set of alerts active from that point on, so a
+    lookup is a binary search per entity key rather than a scan over the alerts.
+
+    Fields an informed entity leaves empty act as wildcards: an entity naming only a route matches every stop and
+    trip on it, while one naming a route and a stop only matches that stop on that route. Entities naming only a
+    route type, e.g. every subway line, match the events on routes of that type. Travel events do not carry their
+    route type, so those entities only match when `route_types` maps the event's route to it. Entities naming only
+    an agency match every event.
+
+    INPUTS
+
+    @rows [iterable]: Past alerts data, either an MBTAPastAlertsResponse or flat row dicts as produced by
+        `iter_past_alert_rows`.
+
+    @route_types [dict]: In route_id : route_type format, e.g. built from the GTFS routes.txt file. Without it,
+        entities naming only a route type are indexed but never matched by route.
+
+    """
+
+    def __init__(self, rows, route_types=None):
+
+        self.route_types = {route_id: str(route_type) for route_id, route_type in (route_types or dict()).items()}
+
+        intervals = collections.defaultdict(list)
+
+        if hasattr(rows, 'columns'):
+            columns = rows.columns
+            rows = (dict(zip(columns, row)) for row in rows)
+
+        for row in rows:
+
+            key = (row.get('route_id') or None, row.get('stop_id') or None, row.get('trip_id') or None)
+
+            if key == (None, None, None):
+
+                if row.get('route_type') not in (None, ''):
+                    key = ('route_type', str(row['route_type']))
+                elif row.get('agency_id') not in (None, ''):
+                    key = ('agency_id',)
+                else:
+                    continue
+
+            intervals[key].append((_epoch_or_none(row.get('start')), _epoch_or_none(row.get('end')),
+                                   row.get('alert_id')))
+
+        # In entity key : (sorted boundary times, [alert ids active from each boundary]) format. Route type and
+        # agency wide entities use ('route_type', route_type) and ('agency_id',) keys.
+        self._segments = {key: self._sweep(periods) for key, periods in intervals.items()}
+
+    @staticmethod
+    def _sweep(periods):
+
+        """ _sweep
+
+        Turns inclusive (start, end, alert_id) periods into sorted boundaries and the alerts active from each one.
+        A missing start means active since forever, a missing end active until further notice.
+
+        """
+
+        changes = collections.defaultdict(list)
+
+        for start, end, alert_id in periods:
+
+            changes[start if start is not None else float('-inf')].append((alert_id, 1))
+
+            if end is not None:
+                changes[end + 1].append((alert_id, -1))
+
+        active = collections.Counter()
+        boundaries, alert_sets = [], []
+
+        for time in sorted(changes):
+
+            for alert_id, change in changes[time]:
+                active[alert_id] += change
+
+            boundaries.append(time)
+            alert_sets.append(frozenset(alert_id for alert_id, count in active.items() if count > 0))
+
+        return boundaries, alert_sets
+
+    def _lookup_key(self, key, time):
+
+        """ _lookup_key
+
+        Alerts active at `time` for one exact entity key.
+
+        """
+
+        segments = self._segments.get(key)
+
+        if segments is None:
+            return frozenset()
+
+        boundaries, alert_sets = segments
+        position = bisect.bisect_right(boundaries, time) - 1
+
+        if position < 0:
+            return frozenset()
+
+        return alert_sets[position]
+
+    def lookup(self, time, route_id=None, stop_id=None, trip_id=None, route_type=None):
+
+        """ lookup
+
+        Finds the alerts in effect at a point in time for a route, stop and trip.
+
+        INPUTS
+
+        @time [int]: Epoch timestamp to check.
+
+        @route_id [str]: Route of the event.
+
+        @stop_id [str]: Stop of the event.
+
+        @trip_id [str]: Trip of the event.
+
+        @route_type [str]: Route type of the event. Defaults to the type `route_types` gives the route.
+
+
+        RETURNS
+
+        @alert_ids [frozenset]: IDs of the alerts whose informed entities match and that were active at `time`.
+
+        """
+
+        time = int(time)
+        alert_ids = self._lookup_key(('agency_id',), time)
+
+        if route_type in (None, ''):
+            route_type = self.route_types.get(route_id)
+
+        if route_type is not None:
+            alert_ids = alert_ids | self._lookup_key(('route_type', str(route_type)), time)
+
+        for route_key in {None, route_id or None}:
+            for stop_key in {None, stop_id or None}:
+                for trip_key in {None, trip_id or None}:
+                    alert_ids = alert_ids | self._lookup_key((route_key, stop_key, trip_key), time)
+
+        return alert_ids
+
+    def annotate(self, events, time_column='event_time'):
+
+        """ annotate
+
+        Matches every travel event with the alerts in effect for it.
+
+        INPUTS
+
+        @events [MBTAPerformanceResponse]: Response with route_id, stop_id, trip_id and `time_column` columns,
+            e.g. from get_travel_events.
+
+        @time_column [str]: Column holding the epoch time of each event.
+
+
+        RETURNS
+
+        @annotated [generator of tuples]: (event tuple, frozenset of alert ids) for each event, in order.
+
+        """
+
+        columns = events.columns
+        position = {key: columns.index(key) if key in columns else None
+                    for key in ('route_id', 'stop_id', 'trip_id', time_column)}
+
+        for row in events:
+
+            time = row[position[time_column]]
+
+            if time is None or time == '':
+                yield row, frozenset()
+                continue
+
+            yield row, self.lookup(time, *(row[position[key]] if position[key] is not None else None
+                                           for key in ('route_id', 'stop_id', 'trip_id')))
@@ -0,0 +1,299 @@
+"""
+filename: mbta/batch.py
+author: Jared Stufft, jared@stufft.us
+desc: Declarative batch querying for the MBTA performance API. Many query specs are normalized, deduplicated and
+merged into the smallest set of API calls, which are then run concurrently.
+"""
+
+import collections
+import datetime as dt
+
+import mbta.utils
+
+
+QuerySpec = collections.namedtuple('QuerySpec', ['method', 'from_datetime', 'to_datetime', 'params'])
+
+# In API method : (row column used to narrow merged results back down to a spec's date range) format.
+# Methods taking epoch ranges are narrowed on an epoch column, methods taking service dates on `service_date`.
+# Prediction metrics only carry seconds after midnight, so they are narrowed on `service_date` as well.
+METHOD_TIME_COLUMNS = {
+    'get_travel_times': 'dep_dt',
+    'get_dwell_times': 'arr_dt',
+    'get_headway_times': 'current_dep_dt',
+    'get_daily_metrics': 'service_date',
+    'get_daily_prediction_metrics': 'service_date',
+    'get_prediction_metrics': 'service_date',
+    'get_travel_events': 'event_time',
+    'get_past_alerts': 'start',
+    'get_current_metrics': None
+}
+
+# In API method : (start column, end column) format, for methods whose rows cover a period rather than a point in
+# time. Their rows are kept for every spec whose range the period overlaps, and a missing end means still ongoing.
+METHOD_PERIOD_COLUMNS = {
+    'get_past_alerts': ('start', 'end')
+}
+
+SERVICE_DATE_METHODS = ('get_daily_metrics', 'get_daily_prediction_metrics')
+
+# In API method : longest range in days a merged call may cover format. Merging stops at this span, matching the
+# ranges the performance endpoints accept. A single spec longer than this is still sent as requested.
+METHOD_MAX_SPAN_DAYS = {
+    'get_travel_times': 7,
+    'get_dwell_times': 7,
+    'get_headway_times': 7,
+    'get_daily_metrics': 30,
+    'get_daily_prediction_metrics': 30,
+    'get_prediction_metrics': 7,
+    'get_travel_events': 7,
+    'get_past_alerts': 7
+}
+
+
+def make_query_spec(method, from_datetime=None, to_datetime=None, **params):
+
+    """ make_query_spec
+
+    Builds a hashable, normalized query spec for one call to an MBTAPerformanceAPI method. Dates are stored in
+    canonical YYYY-MM-DD form and parameters left as None are dropped, so that `route=None` and an omitted route
+    describe the same query.
+
+    INPUTS
+
+    @method [str]: The MBTAPerformanceAPI method name, e.g. 'get_travel_times'.
+
+    @from_datetime [str]: a string in YYYY-MM-DD format denoting the beginning of the time interval to search for.
+
+    @to_datetime [str]: a string in YYYY-MM-DD format denoting the end of the time interval to search for.
+
+    @params [kwargs]: Any other keyword arguments accepted by the method, such as `from_stop` or `route`.
+
+
+    RETURNS
+
+    @spec [QuerySpec]: Hashable query spec usable as a dictionary key.
+
+    """
+
+    if method not in METHOD_TIME_COLUMNS:
+        raise ValueError('Unsupported batch method: {}'.format(method))
+
+    if (from_datetime is None) != (to_datetime is None):
+        raise ValueError('from_datetime and to_datetime must be given together')
+
+    if from_datetime is not None:
+
+        from_date = mbta.utils.date_string_to_datetime(from_datetime)
+        to_date = mbta.utils.date_string_to_datetime(to_datetime)
+
+        if from_date > to_date:
+            raise ValueError('from_datetime {} is after to_datetime {}'.format(from_datetime, to_datetime))
+
+        from_datetime, to_datetime = from_date.strftime('%Y-%m-%d'), to_date.strftime('%Y-%m-%d')
+
+    normalized = tuple(sorted((key, str(value)) for key, value in params.items() if value is not None))
+
+    spec = QuerySpec(method, from_datetime, to_datetime, normalized)
+
+    return spec
+
+
+def _span_days(method, start, end):
+
+    """ _span_days
+
+    Number of days a call from `start` to `end` covers. Service date ranges include their last day.
+
+    """
+
+    days = (mbta.utils.date_string_to_datetime(end) - mbta.utils.date_string_to_datetime(start)).days
+
+    return days + 1 if method in SERVICE_DATE_METHODS else days
+
+
+def _ranges_touch(method, end, start):
+
+    """ _ranges_touch
+
+    Checks if a range starting at `start` overlaps or directly continues a range ending at `end`. Service date
+    ranges are inclusive on both ends, so consecutive days are merged as well.
+
+    """
+
+    if method in SERVICE_DATE_METHODS:
+        next_day = mbta.utils.date_string_to_datetime(end) + dt.timedelta(days=1)
+        return start <= next_day.strftime('%Y-%m-%d')
+
+    return start <= end
+
+
+def plan_batch(specs):
+
+    """ plan_batch
+
+    Deduplicates the given specs and merges overlapping or adjacent date ranges of otherwise identical specs. A
+    merged call is split, by starting a new call, once extending it would cover more than the method's
+    METHOD_MAX_SPAN_DAYS.
+
+    INPUTS
+
+    @specs [iterable of QuerySpec]: The query specs to plan.
+
+
+    RETURNS
+
+    @plan [dict]: In merged call spec : [original specs served by the call] format.
+
+    """
+
+    groups = collections.defaultdict(set)
+
+    for spec in specs:
+        groups[(spec.method, spec.params)].add(spec)
+
+    plan = dict()
+
+    for (method, params), group in groups.items():
+
+        if METHOD_TIME_COLUMNS[method] is None:
+            plan[QuerySpec(method, None, None, params)] = sorted(group)
+            continue
+
+        merged_from, merged_to, members = None, None, []
+
+        for spec in sorted(group, key=lambda s: (s.from_datetime, s.to_datetime)):
+
+            extended_to = max(merged_to, spec.to_datetime) if members else None
+
+            if (members and _ranges_touch(method, merged_to, spec.from_datetime)
+                    and _span_days(method, merged_from, extended_to) <= METHOD_MAX_SPAN_DAYS[method]):
+                merged_to = extended_to
+                members.append(spec)
+                continue
+
+            if members:
+                plan[QuerySpec(method, merged_from, merged_to, params)] = members
+
+            merged_from, merged_to, members = spec.from_datetime, spec.to_datetime, [spec]
+
+        plan[QuerySpec(method, merged_from, merged_to, params)] = members
+
+    return plan
+
+
+def _spec_bounds(spec):
+
+    """ _spec_bounds
+
+    Inclusive lower and upper bound of a spec's range in the form rows are compared in: service date strings for
+    methods narrowed on `service_date`, epoch ints otherwise. Epoch ranges end before `to_datetime`, so methods
+    taking epoch ranges but narrowed on `service_date` cover the service dates in [from_datetime, to_datetime).
+
+    """
+
+    if spec.method in SERVICE_DATE_METHODS:
+        return spec.from_datetime, spec.to_datetime, str
+
+    if METHOD_TIME_COLUMNS[spec.method] == 'service_date':
+        last_date = mbta.utils.date_string_to_datetime(spec.to_datetime) - dt.timedelta(days=1)
+        return spec.from_datetime, last_date.strftime('%Y-%m-%d'), str
+
+    return mbta.utils.date_to_epoch(spec.from_datetime), mbta.utils.date_to_epoch(spec.to_datetime), int
+
+
+def _period_overlaps(start, end, lower, upper):
+
+    """ _period_overlaps
+
+    Checks if a raw epoch period overlaps the range from `lower` to `upper`. A missing start means active since
+    forever, a missing end active until further notice.
+
+    """
+
+    return ((start is None or start == '' or int(start) <= upper)
+            and (end is None or end == '' or int(end) >= lower))
+
+
+def _response_for_spec(spec, call_spec, response):
+
+    """ _response_for_spec
+
+    Narrows the response of a merged call back down to the rows requested by one original spec. Responses of calls
+    that were not merged are returned as-is.
+
+    """
+
+    if spec.from_datetime == call_spec.from_datetime and spec.to_datetime == call_spec.to_datetime:
+        return response
+
+    time_column = METHOD_TIME_COLUMNS[spec.method]
+    lower, upper, convert = _spec_bounds(spec)
+
+    if spec.method in METHOD_PERIOD_COLUMNS:
+        start_column, end_column = METHOD_PERIOD_COLUMNS[spec.method]
+        return response._with_data_list([data_point for data_point in response.data_list
+                                         if _period_overlaps(data_point.get(start_column),
+                                                             data_point.get(end_column), lower, upper)])
+
+    narrowed = response._with_data_list([data_point for data_point in response.data_list
+                                         if data_point.get(time_column) is not None
+                                         and lower <= convert(data_point[time_column]) <= upper])
+
+    return narrowed
+
+
+def _call_spec(api, spec):
+
+    """ _call_spec
+
+    Runs a single API call described by a spec against the given API instance.
+
+    """
+
+    kwargs = dict(spec.params)
+
+    if spec.from_datetime is not None:
+        kwargs['from_datetime'] = spec.from_datetime
+        kwargs['to_datetime'] = spec.to_datetime
+
+    return getattr(api, spec.method)(**kwargs)
+
+
+def run_batch(api, specs, max_workers=8):
+
+    """ run_batch
+
+    Plans and runs a batch of queries, issuing the minimum set of API calls concurrently.
+
+    INPUTS
+
+    @api [MBTAPerformanceAPI]: The API instance used to make the calls.
+
+    @specs [iterable of QuerySpec]: Query specs, as built by `make_query_spec`.
+
+    @max_workers [int]: Maximum number of API calls in flight at once.
+
+
+    RETURNS
+
+    @results [dict]: In original spec : MBTAPerformanceResponse format. A call that fails raises its exception here.
+
+    """
+
+    from concurrent.futures import ThreadPoolExecutor  # Pulls in logging, so only imported when a batch runs.
+
+    plan = plan_batch(specs)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {call_spec: executor.submit(_call_spec, api, call_spec) for call_spec in plan}
+
+    results = dict()
+
+    for call_spec, members in plan.items():
+
+        response = futures[call_spec].result()
+
+        for spec in members:
+            results[spec] = _response_for_spec(spec, call_spec, response)
+
+    return results
@@ -0,0 +1,290 @@
+"""
+filename: mbta/export.py
+author: Jared Stufft, jared@stufft.us
+desc: Streams response data to CSV, JSON Lines or Arrow IPC files straight from each response's rows, so a
+long run of window responses can be written as one file without building the full list of rows in memory.
+"""
+
+import csv
+import datetime as dt
+import itertools
+import json
+
+import mbta.response
+import mbta.utils
+
+
+DEFAULT_BATCH_SIZE = 10000
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+
+def _as_responses(responses):
+
+    """ _as_responses
+
+    Allows a single response to be passed wherever a sequence of responses is expected.
+
+    """
+
+    if isinstance(responses, (mbta.response.Response, mbta.response.ResponseView)):
+        return iter([responses])
+
+    return iter(responses)
+
+
+def _row_batches(responses, pretty, batch_size):
+
+    """ _row_batches
+
+    Yields the columns of the first response, then lists of at most `batch_size` row tuples across all responses.
+    Rows are read lazily from each response, whether it holds its raw data list or compact columns.
+
+    """
+
+    responses = _as_responses(responses)
+
+    first = next(responses, None)
+
+    if first is None:
+        return
+
+    yield first.columns
+
+    for response in itertools.chain([first], responses):
+
+        if response.data_type != first.data_type:
+            raise ValueError('Cannot export {} rows into a {} file'.format(response.data_type, first.data_type))
+
+        if pretty:
+            rows = response.iter_pretty_tuples()
+        elif response.is_compact:
+            rows = (_raw_strings(row) for row in response)
+        else:
+            rows = iter(response)
+
+        while True:
+
+            batch = list(itertools.islice(rows, batch_size))
+
+            if not batch:
+                break
+
+            yield batch
+
+
+def _raw_strings(row):
+
+    """ _raw_strings
+
+    Converts the typed values of a compacted response's row back to strings, so raw exports hold the same string
+    values whether or not a response was compacted.
+
+    """
+
+    return tuple(value if value is None or isinstance(value, str) else str(value) for value in row)
+
+
+def _open(file, mode, buffer_size, **kwargs):
+
+    """ _open
+
+    Opens a path with the given write buffer size. File objects are passed through and left open for the caller.
+
+    """
+
+    if hasattr(file, 'write'):
+        return file, False
+
+    return open(file, mode, buffering=buffer_size, **kwargs), True
+
+
+def _json_default(value):
+
+    """ _json_default
+
+    Serializes the datetimes produced by prettified rows as ISO 8601 strings.
+
+    """
+
+    if isinstance(value, dt.datetime):
+        return value.isoformat()
+
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(value).__name__))
+
+
+def write_csv(responses, file, pretty=False, header=True, batch_size=DEFAULT_BATCH_SIZE,
+              buffer_size=DEFAULT_BUFFER_SIZE):
+
+    """ write_csv
+
+    Writes responses to one CSV file, with columns in `column_map` order.
+
+    INPUTS
+
+    @responses [Response or iterable of Response]: The responses or response slices to write, e.g. a generator of
+        window responses. All must share the same data type.
+
+    @file [str or file]: Path to write to, or an open text file.
+
+    @pretty [bool]: Write prettify'd values instead of the raw API values.
+
+    @header [bool]: Write the column names as the first line.
+
+    @batch_size [int]: Number of rows converted and written at a time.
+
+    @buffer_size [int]: Write buffer size in bytes when `file` is a path.
+
+
+    RETURNS
+
+    @rows [int]: Number of rows written.
+
+    """
+
+    handle, owned = _open(file, 'w', buffer_size, newline='')
+    rows = 0
+
+    try:
+        writer = csv.writer(handle)
+        batches = _row_batches(responses, pretty, batch_size)
+
+        columns = next(batches, None)
+
+        if columns and header:
+            writer.writerow(columns)
+
+        for batch in batches:
+            writer.writerows(batch)
+            rows += len(batch)
+
+    finally:
+        if owned:
+            handle.close()
+
+    return rows
+
+
+def write_jsonl(responses, file, pretty=False, batch_size=DEFAULT_BATCH_SIZE, buffer_size=DEFAULT_BUFFER_SIZE):
+
+    """ write_jsonl
+
+    Writes responses to one JSON Lines file, one object per row with keys in `column_map` order. Prettify'd
+    datetimes are written as ISO 8601 strings.
+
+    INPUTS
+
+    @responses [Response or iterable of Response]: The responses or response slices to write, e.g. a generator of
+        window responses. All must share the same data type.
+
+    @file [str or file]: Path to write to, or an open text file.
+
+    @pretty [bool]: Write prettify'd values instead of the raw API values.
+
+    @batch_size [int]: Number of rows converted and written at a time.
+
+    @buffer_size [int]: Write buffer size in bytes when `file` is a path.
+
+
+    RETURNS
+
+    @rows [int]: Number of rows written.
+
+    """
+
+    handle, owned = _open(file, 'w', buffer_size)
+    rows = 0
+
+    try:
+        batches = _row_batches(responses, pretty, batch_size)
+
+        columns = next(batches, None)
+
+        for batch in batches:
+            handle.write(''.join(json.dumps(dict(zip(columns, row)), default=_json_default) + '\n' for row in batch))
+            rows += len(batch)
+
+    finally:
+        if owned:
+            handle.close()
+
+    return rows
+
+
+def _arrow_type(pa, prettify_function):
+
+    """ _arrow_type
+
+    Arrow column type for a prettify'd column, based on the function used to prettify it.
+
+    """
+
+    if prettify_function is int:
+        return pa.int64()
+
+    if prettify_function is float:
+        return pa.float64()
+
+    if prettify_function in (mbta.utils.epoch_to_datetime, mbta.utils.date_string_to_datetime):
+        return pa.timestamp('s')
+
+    return pa.string()
+
+
+def write_arrow(responses, file, pretty=False, batch_size=DEFAULT_BATCH_SIZE):
+
+    """ write_arrow
+
+    Writes responses to one Arrow IPC stream file, one record batch per `batch_size` rows. Raw values are written
+    as strings; with `pretty` each column gets the type of its prettify function. Requires pyarrow.
+
+    INPUTS
+
+    @responses [Response or iterable of Response]: The responses or response slices to write, e.g. a generator of
+        window responses. All must share the same data type.
+
+    @file [str or file]: Path to write to, or an open binary file.
+
+    @pretty [bool]: Write prettify'd, typed values instead of the raw API strings.
+
+    @batch_size [int]: Number of rows per record batch.
+
+
+    RETURNS
+
+    @rows [int]: Number of rows written.
+
+    """
+
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError('write_arrow requires pyarrow. Install it with `pip install pyarrow`.')
+
+    responses = _as_responses(responses)
+
+    first = next(responses, None)
+
+    if first is None:
+        return 0
+
+    if pretty:
+        schema = pa.schema([(key, _arrow_type(pa, first.prettify_functions.get(key))) for key in first.columns])
+    else:
+        schema = pa.schema([(key, pa.string()) for key in first.columns])
+
+    rows = 0
+
+    batches = _row_batches(itertools.chain([first], responses), pretty, batch_size)
+
+    next(batches)  # Column names, already covered by the schema.
+
+    with pa.ipc.new_stream(file, schema) as writer:
+
+        for batch in batches:
+
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+            writer.write_batch(pa.record_batch(arrays, schema=schema))
+            rows += len(batch)
+
+    return rows
@@ -0,0 +1,366 @@
+"""
+filename: mbta/monitor.py
+author: Jared Stufft, jared@stufft.us
+desc: Incremental anomaly detection over daily metrics. Rolling statistics per route, threshold and time period are
+kept in a small state file, so each run only has to fetch and process the newest service dates.
+"""
+
+import bisect
+import collections
+import datetime as dt
+import json
+import math
+import os
+
+import mbta.batch
+import mbta.utils
+
+
+Anomaly = collections.namedtuple('Anomaly', ['data_type', 'route_id', 'threshold_id', 'time_period_type',
+                                             'service_date', 'metric_result', 'mean', 'std', 'median',
+                                             'robust_z_score'])
+
+# In response data type : MBTAPerformanceAPI method format
+MONITORED_METHODS = {
+    'daily_metrics': 'get_daily_metrics',
+    'daily_prediction_metrics': 'get_daily_prediction_metrics'
+}
+
+# Scales the median absolute deviation to the standard deviation of normally distributed data.
+MAD_SCALE = 1.4826
+
+
+class _RollingSeries:
+
+    """ _RollingSeries
+
+    The last `window` values of one metric series, with running sums for O(1) mean and variance updates and a
+    sorted copy of the values for the median and MAD.
+
+    """
+
+    __slots__ = ('values', 'sorted_values', 'total', 'total_sq')
+
+    def __init__(self, values, window):
+
+        self.values = collections.deque((tuple(value) for value in values), maxlen=window)
+        self.sorted_values = sorted(value for _, value in self.values)
+        self.total = sum(value for _, value in self.values)
+        self.total_sq = sum(value * value for _, value in self.values)
+
+    @property
+    def last_service_date(self):
+
+        """ last_service_date
+
+        Most recent service date in the window, or None for an empty series.
+
+        """
+
+        return self.values[-1][0] if self.values else None
+
+    def append(self, service_date, value):
+
+        """ append
+
+        Adds a value, evicting the oldest one once the window is full.
+
+        """
+
+        if len(self.values) == self.values.maxlen:
+            _, evicted = self.values[0]
+            self.total -= evicted
+            self.total_sq -= evicted * evicted
+            del self.sorted_values[bisect.bisect_left(self.sorted_values, evicted)]
+
+        self.values.append((service_date, value))
+        bisect.insort(self.sorted_values, value)
+        self.total += value
+        self.total_sq += value * value
+
+    def mean_std(self):
+
+        """ mean_std
+
+        Mean and sample standard deviation of the window, from the running sums.
+
+        """
+
+        count = len(self.values)
+        mean = self.total / count
+        variance = max(0.0, (self.total_sq - self.total * mean) / (count - 1)) if count > 1 else 0.0
+
+        return mean, math.sqrt(variance)
+
+    def median_mad(self):
+
+        """ median_mad
+
+        Median and median absolute deviation of the window, in O(window) without sorting. The median is read off
+        the sorted values. The absolute deviations below and above the median are each already ordered, so the MAD
+        is found by merging the two runs outward from the median until the middle deviation is reached.
+
+        """
+
+        values = self.sorted_values
+        count = len(values)
+        middle = count // 2
+        median = values[middle] if count % 2 else (values[middle - 1] + values[middle]) / 2
+
+        below, above = middle - 1, middle
+        deviations = []
+
+        while len(deviations) <= middle:
+
+            if above < count and (below < 0 or values[above] - median <= median - values[below]):
+                deviations.append(values[above] - median)
+                above += 1
+            else:
+                deviations.append(median - values[below])
+                below -= 1
+
+        mad = deviations[middle] if count % 2 else (deviations[middle - 1] + deviations[middle]) / 2
+
+        return median, mad
+
+
+class MetricAnomalyMonitor:
+
+    """ MetricAnomalyMonitor
+
+    Watches `metric_result` of daily metrics and daily prediction metrics responses for sudden changes, keyed by
+    (route_id, threshold_id, time_period_type). Each new value is scored against the rolling window before it using
+    a robust z-score (median and MAD), falling back to the mean and standard deviation when the MAD is zero.
+
+    INPUTS
+
+    @state_path [str]: Path of the JSON state file. It is created on the first `save`.
+
+    @window [int]: Number of most recent service dates kept per series.
+
+    @min_history [int]: Number of values a series needs before it can report anomalies.
+
+    @z_threshold [float]: Score beyond which a value is reported.
+
+    @drops_only [bool]: Only report values below the rolling median, not spikes.
+
+    """
+
+    def __init__(self, state_path, window=90, min_history=14, z_threshold=3.5, drops_only=True):
+
+        self.state_path = state_path
+        self.window = window
+        self.min_history = min_history
+        self.z_threshold = z_threshold
+        self.drops_only = drops_only
+
+        self.series = dict()
+        self.last_service_dates = dict()
+
+        self._load()
+
+    @staticmethod
+    def _series_key(data_type, route_id, threshold_id, time_period_type):
+
+        """ _series_key
+
+        State file key for one metric series.
+
+        """
+
+        return '|'.join((data_type, route_id or '', threshold_id or '', time_period_type or ''))
+
+    @staticmethod
+    def _watermark_key(data_type, route):
+
+        """ _watermark_key
+
+        State file key for the last service date fetched for one endpoint and route filter. Routes are tracked
+        separately so each monitored route seeds and advances on its own.
+
+        """
+
+        return '|'.join((data_type, route or ''))
+
+    def _load(self):
+
+        """ _load
+
+        Reads the state file if one exists.
+
+        """
+
+        if not os.path.exists(self.state_path):
+            return
+
+        with open(self.state_path, 'r') as f:
+            state = json.load(f)
+
+        # State files written before watermarks were kept per route used the bare data type, i.e. all routes.
+        self.last_service_dates = {(key if '|' in key else self._watermark_key(key, None)): date
+                                   for key, date in state.get('last_service_dates', dict()).items()}
+        self.series = {key: _RollingSeries(values, self.window) for key, values in state.get('series', dict()).items()}
+
+        return
+
+    def save(self):
+
+        """ save
+
+        Writes the state file, replacing the old one only once the new one is fully written.
+
+        """
+
+        state = {
+            'last_service_dates': self.last_service_dates,
+            'series': {key: list(series.values) for key, series in self.series.items()}
+        }
+
+        temp_path = self.state_path + '.tmp'
+
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+
+        os.replace(temp_path, self.state_path)
+
+        return
+
+    def _score(self, series, value):
+
+        """ _score
+
+        Scores a value against the series' current window, returning the stats used and the z-score.
+
+        """
+
+        mean, std = series.mean_std()
+        median, mad = series.median_mad()
+
+        if mad:
+            score = (value - median) / (MAD_SCALE * mad)
+        elif std:
+            score = (value - mean) / std
+        else:
+            score = 0.0
+
+        return mean, std, median, score
+
+    def update(self, response):
+
+        """ update
+
+        Adds the rows of a daily metrics or daily prediction metrics response to the rolling statistics. Rows for
+        service dates a series has already seen are skipped, so overlapping fetches are safe.
+
+        INPUTS
+
+        @response [MBTAPerformanceResponse]: Response from get_daily_metrics or get_daily_prediction_metrics.
+
+
+        RETURNS
+
+        @anomalies [list of Anomaly]: The new values that scored beyond the threshold.
+
+        """
+
+        if response.data_type not in MONITORED_METHODS:
+            raise ValueError('Cannot monitor {} responses'.format(response.data_type))
+
+        columns = response.columns
+        get = {key: columns.index(key) if key in columns else None
+               for key in ('service_date', 'route_id', 'threshold_id', 'time_period_type', 'metric_result')}
+
+        rows = sorted((row for row in response if row[get['metric_result']] not in (None, '')),
+                      key=lambda row: row[get['service_date']])
+
+        anomalies = []
+
+        for row in rows:
+
+            service_date = row[get['service_date']]
+            route_id, threshold_id = row[get['route_id']], row[get['threshold_id']]
+            time_period_type = row[get['time_period_type']] if get['time_period_type'] is not None else None
+            value = float(row[get['metric_result']])
+
+            key = self._series_key(response.data_type, route_id, threshold_id, time_period_type)
+            series = self.series.setdefault(key, _RollingSeries([], self.window))
+
+            if series.last_service_date is not None and service_date <= series.last_service_date:
+                continue
+
+            if len(series.values) >= self.min_history:
+
+                mean, std, median, score = self._score(series, value)
+
+                if score <= -self.z_threshold or (not self.drops_only and score >= self.z_threshold):
+                    anomalies.append(Anomaly(response.data_type, route_id, threshold_id, time_period_type,
+                                             service_date, value, mean, std, median, score))
+
+            series.append(service_date, value)
+
+        return anomalies
+
+    def fetch_and_update(self, api, to_date=None, route=None, save=True):
+
+        """ fetch_and_update
+
+        Fetches only the service dates not yet seen for each monitored endpoint and route, and updates the
+        statistics. The first run for a route fetches the whole window to seed its history. Later runs start again
+        from the newest service date that had rows, so dates published late are picked up on the next run; rows a
+        series has already seen are skipped by `update`. Ranges longer than the endpoint's METHOD_MAX_SPAN_DAYS are
+        fetched in consecutive windows.
+
+        INPUTS
+
+        @api [MBTAPerformanceAPI]: The API instance used to make the calls.
+
+        @to_date [str]: Last service date to fetch, in YYYY-MM-DD format. Defaults to yesterday.
+
+        @route [str]: The route name to monitor. If not included, all routes are monitored.
+
+        @save [bool]: Write the state file after updating.
+
+
+        RETURNS
+
+        @anomalies [list of Anomaly]: The new values that scored beyond the threshold.
+
+        """
+
+        to_date = to_date or (dt.date.today() - dt.timedelta(days=1)).strftime('%Y-%m-%d')
+        last_date = mbta.utils.date_string_to_datetime(to_date)
+
+        anomalies = []
+
+        for data_type, method in MONITORED_METHODS.items():
+
+            watermark_key = self._watermark_key(data_type, route)
+            last_seen = self.last_service_dates.get(watermark_key)
+
+            if last_seen:
+                from_date = mbta.utils.date_string_to_datetime(last_seen)
+            else:
+                from_date = last_date - dt.timedelta(days=self.window - 1)
+
+            span = dt.timedelta(days=mbta.batch.METHOD_MAX_SPAN_DAYS[method])
+
+            while from_date <= last_date:
+
+                window_to = min(from_date + span - dt.timedelta(days=1), last_date)
+
+                response = getattr(api, method)(from_date.strftime('%Y-%m-%d'), window_to.strftime('%Y-%m-%d'),
+                                                route=route)
+
+                anomalies.extend(self.update(response))
+
+                newest = max((row[response.columns.index('service_date')] or '' for row in response), default='')
+
+                if newest > self.last_service_dates.get(watermark_key, ''):
+                    self.last_service_dates[watermark_key] = newest
+
+                from_date = window_to + dt.timedelta(days=1)
+
+        if save:
+            self.save()
+
+        return anomalies
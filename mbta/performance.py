@@ -5,6 +5,7 @@ desc: Contains wrapper around the MBTA performance API. Allows a pythonic approa
 data for MBTA travels.
 """
 
+import mbta.batch
 import mbta.response
 import mbta.utils
 
@@ -16,13 +17,36 @@ class MBTAPerformanceAPI:
                     '-documentation-version-0-9-5-public.pdf'
     API_KEY_ENV_VARIABLE = 'MBTA_PERFORMANCE_API_KEY'
 
-    def __init__(self, api_key=None):
+    # In endpoint : priority class format. Endpoints not listed use the 'default' class.
+    ENDPOINT_PRIORITIES = {
+        'currentmetrics': 'interactive',
+        'events': 'bulk'
+    }
+
+    def __init__(self, api_key=None, priority=None, timeout=None):
 
         self.params = {
             'format': 'json',
             'api_key': mbta.utils.authorize_api(api_key, self.API_KEY_ENV_VARIABLE)
         }
 
+        self.priority = priority
+        self.timeout = timeout
+
+    def _priority(self, endpoint):
+
+        """ _priority
+
+        Priority class for calls to the given endpoint. A priority set on the instance, e.g. 'bulk' for a backfill
+        job, overrides the per-endpoint defaults.
+
+        """
+
+        if self.priority:
+            return self.priority
+
+        return self.ENDPOINT_PRIORITIES.get(endpoint, 'default')
+
     def get_travel_times(self, from_datetime, to_datetime, from_stop, to_stop, route=None):
         
         """ get_travel_times
@@ -62,7 +86,9 @@ class MBTAPerformanceAPI:
 
         call_params = mbta.utils.merge_dicts(params, self.params)
 
-        content, status_code = mbta.utils.make_api_call(self.HOST, ['traveltimes'], params=call_params)
+        content, status_code = mbta.utils.make_api_call(self.HOST, ['traveltimes'], params=call_params,
+                                                        priority=self._priority('traveltimes'),
+                                                        timeout=self.timeout)
 
         response = mbta.response.MBTAPerformanceResponse(content, status_code)
         
@@ -108,7 +134,9 @@ class MBTAPerformanceAPI:
 
         call_params = mbta.utils.merge_dicts(params, self.params)
 
-        content, status_code = mbta.utils.make_api_call(self.HOST, ['dwells'], params=call_params)
+        content, status_code = mbta.utils.make_api_call(self.HOST, ['dwells'], params=call_params,
+                                                        priority=self._priority('dwells'),
+                                                        timeout=self.timeout)
 
         response = mbta.response.MBTAPerformanceResponse(content, status_code)
 
@@ -156,7 +184,9 @@ class MBTAPerformanceAPI:
 
         call_params = mbta.utils.merge_dicts(params, self.params)
 
-        content, status_code = mbta.utils.make_api_call(self.HOST, ['headways'], params=call_params)
+        content, status_code = mbta.utils.make_api_call(self.HOST, ['headways'], params=call_params,
+                                                        priority=self._priority('headways'),
+                                                        timeout=self.timeout)
 
         response = mbta.response.MBTAPerformanceResponse(content, status_code)
 
@@ -194,7 +224,9 @@ class MBTAPerformanceAPI:
 
         call_params = mbta.utils.merge_dicts(params, self.params)
 
-        content, status_code = mbta.utils.make_api_call(self.HOST, ['dailymetrics'], params=call_params)
+        content, status_code = mbta.utils.make_api_call(self.HOST, ['dailymetrics'], params=call_params,
+                                                        priority=self._priority('dailymetrics'),
+                                                        timeout=self.timeout)
 
         response = mbta.response.MBTAPerformanceResponse(content, status_code)
 
@@ -223,7 +255,9 @@ class MBTAPerformanceAPI:
 
         call_params = mbta.utils.merge_dicts(params, self.params)
 
-        content, status_code = mbta.utils.make_api_call(self.HOST, ['currentmetrics'], params=call_params)
+        content, status_code = mbta.utils.make_api_call(self.HOST, ['currentmetrics'], params=call_params,
+                                                        priority=self._priority('currentmetrics'),
+                                                        timeout=self.timeout)
 
         response = mbta.response.MBTAPerformanceResponse(content, status_code)
 
@@ -260,7 +294,9 @@ class MBTAPerformanceAPI:
 
         call_params = mbta.utils.merge_dicts(params, self.params)
 
-        content, status_code = mbta.utils.make_api_call(self.HOST, ['dailypredictionmetrics'], params=call_params)
+        content, status_code = mbta.utils.make_api_call(self.HOST, ['dailypredictionmetrics'], params=call_params,
+                                                        priority=self._priority('dailypredictionmetrics'),
+                                                        timeout=self.timeout)
 
         response = mbta.response.MBTAPerformanceResponse(content, status_code)
 
@@ -306,7 +342,9 @@ class MBTAPerformanceAPI:
 
         call_params = mbta.utils.merge_dicts(params, self.params)
 
-        content, status_code = mbta.utils.make_api_call(self.HOST, ['predictionmetrics'], params=call_params)
+        content, status_code = mbta.utils.make_api_call(self.HOST, ['predictionmetrics'], params=call_params,
+                                                        priority=self._priority('predictionmetrics'),
+                                                        timeout=self.timeout)
 
         response = mbta.response.MBTAPerformanceResponse(content, status_code)
 
@@ -359,59 +397,85 @@ class MBTAPerformanceAPI:
 
         call_params = mbta.utils.merge_dicts(params, self.params)
 
-        content, status_code = mbta.utils.make_api_call(self.HOST, ['events'], params=call_params)
+        content, status_code = mbta.utils.make_api_call(self.HOST, ['events'], params=call_params,
+                                                        priority=self._priority('events'),
+                                                        timeout=self.timeout)
 
         response = mbta.response.MBTAPerformanceResponse(content, status_code)
 
         return response
 
-    # TODO: Add this back in when there's time to parse the response.
-    # def get_past_alerts(self, from_datetime, to_datetime, trip=None, stop=None, route=None):
-    #
-    #     """ get_past_alerts
-    #
-    #     This query returns a list of arrival and departure events during the time period defined in the call.
-    #
-    #     INPUTS
-    #
-    #     @vehicle_label [str]: human-readable, publicly visible identifier for the vehicle
-    #
-    #     @from_datetime [str]: a string in YYYY-MM-DD format denoting the beginning of the time interval to search for.
-    #
-    #     @to_datetime [str]: a string in YYYY-MM-DD format denoting the end of the time interval to search for.
-    #
-    #     @stop [str]: The stop_id for the dwell time. Can be found using `get_gtfs_utility_data`
-    #         function from mbta.utils with 'stops.txt' file.
-    #
-    #     @route [str]: The route name for the travel. If not included, will return all travels between the stops.
-    #
-    #     @trip [str]: trip_id value for which alerts should be returned.
-    #
-    #
-    #     RETURNS
-    #
-    #     @response [MBTAPerformanceResponse]: Response from the daily metrics API endpoint
-    #
-    #     """
-    #
-    #     params = {
-    #         'from_datetime': mbta.utils.date_to_epoch(from_datetime),
-    #         'to_datetime': mbta.utils.date_to_epoch(to_datetime)
-    #     }
-    #
-    #     if trip:
-    #         params['trip'] = trip
-    #
-    #     if route:
-    #         params['route'] = route
-    #
-    #     if stop:
-    #         params['stop'] = stop
-    #
-    #     call_params = mbta.utils.merge_dicts(params, self.params)
-    #
-    #     content, status_code = mbta.utils.make_api_call(self.HOST, ['pastalerts'], params=call_params)
-    #
-    #     response = mbta.response.MBTAPerformanceResponse(content, status_code)
-    #
-    #     return response
+    def run_batch(self, specs, max_workers=8):
+
+        """ run_batch
+
+        Run many queries at once. Overlapping specs are deduplicated and merged, and the minimum set of API calls is
+        made concurrently.
+
+        INPUTS
+
+        @specs [iterable of QuerySpec]: Query specs built with `make_query_spec` from mbta.batch, e.g.
+            make_query_spec('get_travel_times', '2018-01-01', '2018-01-07', from_stop='70061', to_stop='70063').
+
+        @max_workers [int]: Maximum number of API calls in flight at once.
+
+
+        RETURNS
+
+        @results [dict]: Responses keyed by the original query spec
+
+        """
+
+        return mbta.batch.run_batch(self, specs, max_workers=max_workers)
+
+    def get_past_alerts(self, from_datetime, to_datetime, trip=None, stop=None, route=None):
+
+        """ get_past_alerts
+
+        This query returns the alerts that were in effect during the time period defined in the call, flattened into
+        one row per alert version, informed entity and active period. Pass the response to `AlertIndex` from
+        mbta.alerts to match travel events with the alerts that applied to them.
+
+        INPUTS
+
+        @from_datetime [str]: a string in YYYY-MM-DD format denoting the beginning of the time interval to search for.
+
+        @to_datetime [str]: a string in YYYY-MM-DD format denoting the end of the time interval to search for.
+
+        @trip [str]: trip_id value for which alerts should be returned.
+
+        @stop [str]: The stop_id for the alerts. Can be found using `get_gtfs_utility_data`
+            function from mbta.utils with 'stops.txt' file.
+
+        @route [str]: The route name for the alerts. If not included, will return alerts for all routes.
+
+
+        RETURNS
+
+        @response [MBTAPastAlertsResponse]: Response from the past alerts API endpoint
+
+        """
+
+        params = {
+            'from_datetime': mbta.utils.date_to_epoch(from_datetime),
+            'to_datetime': mbta.utils.date_to_epoch(to_datetime)
+        }
+
+        if trip:
+            params['trip'] = trip
+
+        if route:
+            params['route'] = route
+
+        if stop:
+            params['stop'] = stop
+
+        call_params = mbta.utils.merge_dicts(params, self.params)
+
+        content, status_code = mbta.utils.make_api_call(self.HOST, ['pastalerts'], params=call_params,
+                                                        priority=self._priority('pastalerts'),
+                                                        timeout=self.timeout)
+
+        response = mbta.response.MBTAPastAlertsResponse(content, status_code)
+
+        return response
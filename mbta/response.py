@@ -1,5 +1,9 @@
+import array
+import copy
 import json
+import sys
 import datetime as dt
+import mbta.alerts
 import mbta.utils
 
 
@@ -7,10 +11,14 @@ class Response:
 
     """ Response
     
-    Base class for responses from MBTA APIs
+    Base class for responses from MBTA APIs. Responses support len(), iteration over raw data tuples and indexing,
+    where slices return a ResponseView over the rows instead of copying them.
     
     """
 
+    __slots__ = ('raw_response', 'data_as_of', 'status_code', 'data_list', 'data_type', '_compact_columns',
+                 '_length', '_tuples', '_pretty_tuples')
+
     # In response type : (response columns) format
     column_map = dict()
 
@@ -18,10 +26,43 @@ class Response:
     
     def __init__(self, raw_response, status_code):
         
-        self.raw_response = json.loads(raw_response)
         self.data_as_of = dt.datetime.now()
         self.status_code = status_code
-        self._set_data_type_data_list()
+        self._compact_columns = None
+        self._tuples = None
+        self._pretty_tuples = None
+        self._decode(raw_response)
+
+    def __len__(self):
+
+        if self._compact_columns is not None:
+            return self._length
+
+        return len(self.data_list)
+
+    def __iter__(self):
+
+        if self._tuples is not None:
+            return iter(self._tuples)
+
+        return self._iter_rows()
+
+    def __getitem__(self, index):
+
+        if isinstance(index, slice):
+            return ResponseView(self, range(len(self))[index])
+
+        index = range(len(self))[index]  # Normalizes negative indexes and raises IndexError when out of range.
+
+        if self._tuples is not None:
+            return self._tuples[index]
+
+        if self._compact_columns is not None:
+            return tuple(self._compact_columns[key][index] for key in self.columns)
+
+        data_point = self.data_list[index]
+
+        return tuple(data_point.get(key) for key in self.columns)
 
     @staticmethod
     def _strip_first_layer_of_dict(data):
@@ -58,6 +99,35 @@ class Response:
 
         return self.column_map[self.data_type]
 
+    @property
+    def is_compact(self):
+
+        """ is_compact
+
+        True once `compact` has replaced the raw payload with typed columns.
+
+        """
+
+        return self._compact_columns is not None
+
+    def _decode(self, raw_response):
+
+        """ _decode
+
+        Decodes the raw response content and sets the raw response, data type and data list from it. Subclasses
+        for endpoints with nested payloads override this.
+
+        INPUTS
+
+        @raw_response [bytes or str]: Raw JSON content from the API call.
+
+        """
+
+        self.raw_response = json.loads(raw_response)
+        self._set_data_type_data_list()
+
+        return
+
     def _set_data_type_data_list(self):
 
         """ _set_data_type_data_list
@@ -73,45 +143,123 @@ class Response:
 
         return
 
+    def _iter_rows(self):
+
+        """ _iter_rows
+
+        Lazily yields each data point as a tuple in column order, without building a list.
+
+        """
+
+        if self._compact_columns is not None:
+            return zip(*(self._compact_columns[key] for key in self.columns))
+
+        columns = self.columns
+
+        return (tuple(data_point.get(key) for key in columns) for data_point in self.data_list)
+
+    def _prettify_row(self, row):
+
+        """ _prettify_row
+
+        Prettifies every value of a raw data tuple, leaving missing values as None.
+
+        """
+
+        return tuple((self.prettify_response(key, value) if value is not None and value != '' else None)
+                     for key, value in zip(self.columns, row))
+
+    def _with_data_list(self, data_list):
+
+        """ _with_data_list
+
+        Returns a copy of the response holding only the given data points. The raw payload is shared, not copied.
+        Compacted responses no longer hold data points, so they cannot be narrowed this way.
+
+        """
+
+        if self._compact_columns is not None:
+            raise ValueError('Cannot replace the data list of a compacted response')
+
+        narrowed = copy.copy(self)
+        narrowed.data_list = data_list
+        narrowed._tuples = None
+        narrowed._pretty_tuples = None
+
+        return narrowed
+
     @property
     def tuples(self):
 
         """ tuples
 
-        Data parsed into a list of tuples
+        Data parsed into a list of tuples. The list is built once and shared between accesses, so it should not be
+        modified in place.
 
         """
 
-        tuples = []
-
-        for data_point in self.data_list:
+        if self._tuples is None:
+            self._tuples = list(self._iter_rows())
 
-            # Sorts the each data point according to the column order in
-            # self.columns, converts first to a list, then a tuple for faster processing later.
-            tuple_ = tuple([data_point.get(key) for key in self.columns])
-            tuples.append(tuple_)
-
-        return tuples
+        return self._tuples
 
     @property
     def pretty_tuples(self):
 
         """ pretty_tuples
 
-        Data parsed into a list of tuples with prettify'd responses
+        Data parsed into a list of tuples with prettify'd responses. The list is built once and shared between
+        accesses, so it should not be modified in place.
+
+        """
+
+        if self._pretty_tuples is None:
+            self._pretty_tuples = [self._prettify_row(row) for row in self]
+
+        return self._pretty_tuples
+
+    def iter_pretty_tuples(self):
+
+        """ iter_pretty_tuples
+
+        Lazily yields prettify'd tuples one at a time, without building or caching the full list.
+
+        """
+
+        return (self._prettify_row(row) for row in self)
+
+    def compact(self):
+
+        """ compact
+
+        Converts the data to one compact column per name in `columns` and frees the raw dict-of-dicts payload.
+        Integer and epoch columns are stored as integer arrays when every value converts without changing its string
+        form, other columns as tuples of interned strings. After compacting, `raw_response` and `data_list` are None
+        and `tuples` holds the typed values, while `pretty_tuples` is unchanged. Cached tuple lists are dropped.
+
+        RETURNS
+
+        @self [Response]: The compacted response, for chaining.
 
         """
 
-        tuples = []
+        if self._compact_columns is not None:
+            return self
 
-        for data_point in self.data_list:
-            # Sorts the each data point according to the column order in
-            # self.columns, converts first to a list, then a tuple for faster processing later.
-            tuple_ = tuple([(self.prettify_response(key, data_point.get(key)) if data_point.get(key)
-                             else None) for key in self.columns])
-            tuples.append(tuple_)
+        compact_columns = dict()
 
-        return tuples
+        for key in self.columns:
+            values = [data_point.get(key) for data_point in self.data_list]
+            compact_columns[key] = _compact_column(self.prettify_functions.get(key), values)
+
+        self._length = len(self.data_list)
+        self._compact_columns = compact_columns
+        self._tuples = None
+        self._pretty_tuples = None
+        self.raw_response = None
+        self.data_list = None
+
+        return self
 
     def prettify_response(self, column_name, data_point):
 
@@ -135,6 +283,96 @@ class Response:
         return data_point
 
 
+class ResponseView:
+
+    """ ResponseView
+
+    Read-only view over a range of a response's rows, as returned by slicing a response. No rows are copied. The
+    view exposes the response's `columns`, `data_type` and prettify helpers, so it can be exported, indexed or
+    monitored like the response itself.
+
+    """
+
+    __slots__ = ('response', 'indexes')
+
+    def __init__(self, response, indexes):
+
+        self.response = response
+        self.indexes = indexes
+
+    def __len__(self):
+
+        return len(self.indexes)
+
+    def __iter__(self):
+
+        return (self.response[index] for index in self.indexes)
+
+    def __getitem__(self, index):
+
+        if isinstance(index, slice):
+            return ResponseView(self.response, self.indexes[index])
+
+        return self.response[self.indexes[index]]
+
+    @property
+    def columns(self):
+
+        return self.response.columns
+
+    @property
+    def data_type(self):
+
+        return self.response.data_type
+
+    @property
+    def is_compact(self):
+
+        return self.response.is_compact
+
+    @property
+    def prettify_functions(self):
+
+        return self.response.prettify_functions
+
+    def prettify_response(self, column_name, data_point):
+
+        return self.response.prettify_response(column_name, data_point)
+
+    def iter_pretty_tuples(self):
+
+        """ iter_pretty_tuples
+
+        Lazily yields prettify'd tuples of the rows in the view.
+
+        """
+
+        return (self.response._prettify_row(row) for row in self)
+
+
+def _compact_column(prettify_function, values):
+
+    """ _compact_column
+
+    Packs one column of raw values into an integer array when the column's prettify function says it holds
+    integers or epochs and every value converts back to the same string, otherwise into a tuple of interned strings.
+    Float columns stay strings, since a float does not keep the API's formatting, e.g. '0.9500'.
+
+    """
+
+    if prettify_function in (int, mbta.utils.epoch_to_datetime):
+
+        try:
+            column = array.array('q', (int(value) for value in values))
+        except (TypeError, ValueError):  # Missing or non-numeric values, keep the column as-is.
+            column = None
+
+        if column is not None and all(str(number) == value for number, value in zip(column, values)):
+            return column
+
+    return tuple(sys.intern(value) if isinstance(value, str) else value for value in values)
+
+
 class MBTAPerformanceResponse(Response):
     
     """ MBTAPerformanceResponse
@@ -143,6 +381,8 @@ class MBTAPerformanceResponse(Response):
     
     """
 
+    __slots__ = ()
+
     # In response type : (response columns) format
     column_map = {'travel_times': ('arr_dt', 'dep_dt', 'travel_time_sec', 'benchmark_travel_time_sec', 'direction',
                                    'route_id'
@@ -170,10 +410,7 @@ class MBTAPerformanceResponse(Response):
                              'event_time', 'event_time_sec', 'direction_id', 'trip_id', 'route_id'
                              ),
 
-                  'past_alerts': ('alert_id', 'alert_versions', 'version_id', 'valid_from', 'valid_to', 'cause',
-                                  'effect', 'header_text', 'description_text', 'informed_entity', 'url', 'agency_id',
-                                  'route_id', 'route_type', 'trip_id', 'stop_id', 'active_period', 'start', 'end'
-                                  )
+                  'past_alerts': mbta.alerts.PAST_ALERT_COLUMNS
                   }
 
     prettify_functions = {
@@ -197,7 +434,6 @@ class MBTAPerformanceResponse(Response):
         'total_predictions_in_bin': int,
         'event_time': mbta.utils.epoch_to_datetime,
         'event_time_sec': int,
-        'active_period': mbta.utils.epoch_to_datetime,
         'start': mbta.utils.epoch_to_datetime,
         'end': mbta.utils.epoch_to_datetime,
         'valid_from': mbta.utils.epoch_to_datetime,
@@ -207,3 +443,30 @@ class MBTAPerformanceResponse(Response):
     def __init__(self, raw_response, status_code):
 
         super().__init__(raw_response=raw_response, status_code=status_code)
+
+
+class MBTAPastAlertsResponse(MBTAPerformanceResponse):
+
+    """ MBTAPastAlertsResponse
+
+    Response class for the MBTA Performance API past alerts call. The nested alert versions, informed entities and
+    active periods are flattened while decoding into one row per (version, entity, active period), so no raw payload
+    is kept.
+
+    """
+
+    __slots__ = ()
+
+    def _decode(self, raw_response):
+
+        """ _decode
+
+        Streams the alerts out of the raw content into flat rows instead of decoding the whole nested tree.
+
+        """
+
+        self.raw_response = None
+        self.data_type = 'past_alerts'
+        self.data_list = list(mbta.alerts.iter_past_alert_rows(raw_response))
+
+        return
@@ -0,0 +1,306 @@
+"""
+filename: mbta/scheduler.py
+author: Jared Stufft, jared@stufft.us
+desc: Priority-aware scheduling of API calls that share one API key. Calls are admitted by weighted fair queuing
+between priority classes, subject to per-class concurrency limits and the key's rate quota.
+"""
+
+import collections
+import contextlib
+import threading
+import time
+
+
+# Priority classes, highest priority first.
+PRIORITY_CLASSES = ('interactive', 'default', 'bulk')
+
+DEFAULT_CLASS_LIMITS = {
+    'interactive': None,
+    'default': None,
+    'bulk': 4
+}
+
+# In priority class : share of admissions under contention format. With these weights a class with waiting calls
+# gets at least its share, so bulk calls keep moving while interactive calls still go first most of the time.
+DEFAULT_CLASS_WEIGHTS = {
+    'interactive': 8,
+    'default': 4,
+    'bulk': 1
+}
+
+_schedulers = dict()
+_schedulers_lock = threading.Lock()
+
+
+class RequestScheduler:
+
+    """ RequestScheduler
+
+    Admits API calls for one API key. Each priority class has its own FIFO queue, and classes are picked by stride
+    scheduling: every admission advances the class's pass by 1 / weight and the waiting class with the lowest pass
+    goes next. Higher priority classes win ties and most turns, but no class with waiting calls is starved. A class
+    at its concurrency limit is skipped so other classes can use the spare quota, and a token bucket keeps the total
+    call rate within the key's quota.
+
+    INPUTS
+
+    @rate [float]: Maximum calls per second allowed by the API key. None for no rate limit.
+
+    @burst [int]: Number of calls that may be made back to back before `rate` applies.
+
+    @class_limits [dict]: In priority class : max concurrent calls format. None means no limit for the class.
+
+    @class_weights [dict]: In priority class : relative share of admissions format.
+
+    @max_concurrency [int]: Maximum concurrent calls across all classes. None for no limit.
+
+    """
+
+    def __init__(self, rate=None, burst=1, class_limits=None, max_concurrency=None, class_weights=None):
+
+        self.rate = rate
+        self.burst = burst
+        self.class_limits = _merge_class_settings(DEFAULT_CLASS_LIMITS, class_limits)
+        self.class_weights = _merge_class_settings(DEFAULT_CLASS_WEIGHTS, class_weights)
+        self.max_concurrency = max_concurrency
+
+        self._condition = threading.Condition()
+        self._waiting = {priority: collections.deque() for priority in PRIORITY_CLASSES}
+        self._pass = {priority: 0.0 for priority in PRIORITY_CLASSES}
+        self._virtual_time = 0.0
+        self._in_flight = {priority: 0 for priority in PRIORITY_CLASSES}
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+
+    def _refill(self):
+
+        """ _refill
+
+        Adds the tokens earned since the last refill, capped at the burst size.
+
+        """
+
+        now = time.monotonic()
+
+        if self.rate is not None:
+            self._tokens = min(float(self.burst), self._tokens + (now - self._last_refill) * self.rate)
+
+        self._last_refill = now
+
+    def _next_eligible(self):
+
+        """ _next_eligible
+
+        Finds the waiting call that should be admitted next: the earliest call of the class with the lowest pass
+        among those with waiting calls and below their concurrency limit. Ties go to the higher priority class.
+
+        """
+
+        best = None
+
+        for priority in PRIORITY_CLASSES:
+
+            limit = self.class_limits[priority]
+
+            if not self._waiting[priority] or (limit is not None and self._in_flight[priority] >= limit):
+                continue
+
+            if best is None or self._pass[priority] < self._pass[best]:
+                best = priority
+
+        return self._waiting[best][0] if best is not None else None
+
+    def _admit_delay(self, entry):
+
+        """ _admit_delay
+
+        Returns 0 if the call can be admitted now, the seconds until the next rate token if it is only waiting on the
+        quota, or None if it has to wait for another call to finish or be admitted first.
+
+        """
+
+        if self.max_concurrency is not None and sum(self._in_flight.values()) >= self.max_concurrency:
+            return None
+
+        if self._next_eligible() != entry:
+            return None
+
+        if self.rate is None:
+            return 0
+
+        self._refill()
+
+        if self._tokens >= 1:
+            return 0
+
+        return (1 - self._tokens) / self.rate
+
+    def acquire(self, priority='default'):
+
+        """ acquire
+
+        Blocks until a call of the given priority class may be made.
+
+        INPUTS
+
+        @priority [str]: One of 'interactive', 'default' or 'bulk'.
+
+        """
+
+        if priority not in PRIORITY_CLASSES:
+            raise ValueError('Unknown priority class: {}. Expected one of {}'.format(priority, PRIORITY_CLASSES))
+
+        entry = object()
+
+        with self._condition:
+
+            queue = self._waiting[priority]
+
+            if not queue:
+                # A class that was idle resumes at the current virtual time instead of spending banked turns.
+                self._pass[priority] = max(self._pass[priority], self._virtual_time)
+
+            queue.append(entry)
+
+            try:
+                delay = self._admit_delay(entry)
+
+                while delay != 0:
+                    self._condition.wait(delay)
+                    delay = self._admit_delay(entry)
+
+            except BaseException:
+                queue.remove(entry)
+                self._condition.notify_all()
+                raise
+
+            queue.popleft()
+
+            self._virtual_time = self._pass[priority]
+            self._pass[priority] += 1 / self.class_weights[priority]
+            self._in_flight[priority] += 1
+
+            if self.rate is not None:
+                self._tokens -= 1
+
+            self._condition.notify_all()
+
+        return
+
+    def release(self, priority='default'):
+
+        """ release
+
+        Marks a call of the given priority class as finished.
+
+        INPUTS
+
+        @priority [str]: One of 'interactive', 'default' or 'bulk'.
+
+        """
+
+        with self._condition:
+            self._in_flight[priority] -= 1
+            self._condition.notify_all()
+
+        return
+
+    @contextlib.contextmanager
+    def slot(self, priority='default'):
+
+        """ slot
+
+        Context manager holding a call slot of the given priority class for the duration of the block.
+
+        INPUTS
+
+        @priority [str]: One of 'interactive', 'default' or 'bulk'.
+
+        """
+
+        self.acquire(priority)
+
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+
+def _merge_class_settings(defaults, settings):
+
+    """ _merge_class_settings
+
+    Fills in the default per-class setting for any class not given.
+
+    """
+
+    merged = {**defaults, **(settings or dict())}
+
+    unknown = set(merged) - set(PRIORITY_CLASSES)
+
+    if unknown:
+        raise ValueError('Unknown priority classes: {}'.format(sorted(unknown)))
+
+    return merged
+
+
+def configure_scheduler(api_key, rate=None, burst=1, class_limits=None, max_concurrency=None, class_weights=None):
+
+    """ configure_scheduler
+
+    Sets up the scheduler shared by every call made with the given API key, replacing any existing one. Calls already
+    waiting on the old scheduler are not moved over.
+
+    INPUTS
+
+    @api_key [str]: The API key the quota belongs to.
+
+    @rate [float]: Maximum calls per second allowed by the API key. None for no rate limit.
+
+    @burst [int]: Number of calls that may be made back to back before `rate` applies.
+
+    @class_limits [dict]: In priority class : max concurrent calls format.
+
+    @max_concurrency [int]: Maximum concurrent calls across all classes. None for no limit.
+
+    @class_weights [dict]: In priority class : relative share of admissions format.
+
+
+    RETURNS
+
+    @scheduler [RequestScheduler]: The new scheduler for the key.
+
+    """
+
+    scheduler = RequestScheduler(rate=rate, burst=burst, class_limits=class_limits, max_concurrency=max_concurrency,
+                                 class_weights=class_weights)
+
+    with _schedulers_lock:
+        _schedulers[api_key] = scheduler
+
+    return scheduler
+
+
+def get_scheduler(api_key):
+
+    """ get_scheduler
+
+    Retrieves the scheduler for the given API key, creating one with default settings if none was configured.
+
+    INPUTS
+
+    @api_key [str]: The API key the quota belongs to.
+
+
+    RETURNS
+
+    @scheduler [RequestScheduler]: The scheduler shared by every call made with the key.
+
+    """
+
+    with _schedulers_lock:
+
+        if api_key not in _schedulers:
+            _schedulers[api_key] = RequestScheduler()
+
+        return _schedulers[api_key]
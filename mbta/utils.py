@@ -4,16 +4,19 @@ author: Jared Stufft, jared@stufft.us
 desc: Allows for access to some helper data and functions.
 """
 
-import requests
 import os
 import datetime as dt
-from zipfile import ZipFile
-from io import BytesIO
+import threading
 import time
 
+import mbta.scheduler
+
 
 GTFS_CONTENT_URL = r'https://cdn.mbta.com/MBTA_GTFS.zip'
 
+# Per-thread timing of the most recent API call, read through `last_call_seconds`.
+_call_timing = threading.local()
+
 
 def get_gtfs_utility_data(file_name):
 
@@ -30,6 +33,10 @@ def get_gtfs_utility_data(file_name):
 
     """
 
+    import requests  # Imported on first network use to keep `import mbta` fast.
+    from io import BytesIO
+    from zipfile import ZipFile
+
     r = requests.get(GTFS_CONTENT_URL)
 
     with ZipFile(BytesIO(r.content)) as zip_file:
@@ -132,11 +139,12 @@ def merge_dicts(dict1, dict2):
     return merged
 
 
-def make_api_call(host, endpoints, params):
+def make_api_call(host, endpoints, params, priority='default', timeout=None):
 
     """ _make_api_call
 
-    Base method for any API call.
+    Base method for any API call. Calls are admitted through the scheduler for the call's API key, so calls sharing
+    a key are ordered by priority and kept within the key's quota (see mbta.scheduler.configure_scheduler).
 
     INPUTS
 
@@ -144,6 +152,10 @@ def make_api_call(host, endpoints, params):
 
     @endpoint [str]: the API method being used
 
+    @priority [str]: Priority class of the call, one of 'interactive', 'default' or 'bulk'.
+
+    @timeout [float]: Seconds to wait for the server before raising requests.exceptions.Timeout. None waits forever.
+
 
     RETURNS
 
@@ -151,15 +163,38 @@ def make_api_call(host, endpoints, params):
 
     """
 
+    import requests  # Imported on first network use to keep `import mbta` fast.
+
     call_url = create_api_host_url(host, endpoints)
 
-    r = requests.get(call_url, params=params)
+    scheduler = mbta.scheduler.get_scheduler(params.get('api_key'))
+
+    with scheduler.slot(priority):
+        started = time.monotonic()
+        r = requests.get(call_url, params=params, timeout=timeout)
+        _call_timing.seconds = time.monotonic() - started
 
     r.raise_for_status()  # HTTPError if 4XX or 5XX status code on response.
 
     return r.content, r.status_code
 
 
+def last_call_seconds():
+
+    """ last_call_seconds
+
+    Time the most recent successful API call made on the current thread spent on the HTTP request itself,
+    excluding any wait for a scheduler slot.
+
+    RETURNS
+
+    @seconds [float]: Seconds spent in the request, or None if this thread has not made a call yet.
+
+    """
+
+    return getattr(_call_timing, 'seconds', None)
+
+
 def authorize_api(api_key, api_key_env):
 
     """ authorize_api
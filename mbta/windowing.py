@@ -0,0 +1,261 @@
+"""
+filename: mbta/windowing.py
+author: Jared Stufft, jared@stufft.us
+desc: Splits long date ranges into windows sized from the row counts and latencies of earlier responses, so sparse
+data is fetched in few large calls and dense data in smaller, faster ones.
+"""
+
+import datetime as dt
+import threading
+
+import mbta.batch
+import mbta.utils
+
+
+class AdaptiveWindowPlanner:
+
+    """ AdaptiveWindowPlanner
+
+    Learns, per API method and query parameters (route, stop, ...), how many rows a day of data holds and how long
+    each row takes to fetch, and picks window lengths that aim for `target_rows` rows per call. A window that times
+    out is halved and retried, and the key's windows are then capped below the length that timed out. The cap is
+    raised by a day only after `ceiling_recovery` successful windows at the cap, so the planner probes back up
+    slowly instead of returning to a length that times out. One planner can be shared across threads and fetches
+    so it keeps learning.
+
+    INPUTS
+
+    @target_rows [int]: Number of rows each call should aim to return.
+
+    @target_seconds [float]: Optional latency each call should aim to stay under.
+
+    @min_days [int]: Smallest window length. A timeout on a window this short is raised to the caller.
+
+    @max_days [int]: Largest window length.
+
+    @initial_days [int]: Window length used before anything has been learned for a query.
+
+    @smoothing [float]: Weight of the newest observation in the running averages, between 0 and 1.
+
+    @ceiling_recovery [int]: Successful windows at the timeout cap needed before the cap is raised by one day.
+
+    """
+
+    def __init__(self, target_rows=5000, target_seconds=None, min_days=1, max_days=7, initial_days=1,
+                 smoothing=0.3, ceiling_recovery=5):
+
+        self.target_rows = target_rows
+        self.target_seconds = target_seconds
+        self.min_days = min_days
+        self.max_days = max_days
+        self.initial_days = initial_days
+        self.smoothing = smoothing
+        self.ceiling_recovery = ceiling_recovery
+
+        # In stats key : [rows per day, seconds per row] format.
+        self._stats = dict()
+
+        # In stats key : [longest window allowed after a timeout, successful windows at that length] format.
+        self._ceilings = dict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def stats_key(method, params):
+
+        """ stats_key
+
+        Key the planner learns under: the method and its normalized non-date parameters.
+
+        """
+
+        return method, mbta.batch.make_query_spec(method, **params).params
+
+    def _blend(self, old, new):
+
+        """ _blend
+
+        Exponentially weighted running average of an observed value.
+
+        """
+
+        if old is None:
+            return new
+
+        return (1 - self.smoothing) * old + self.smoothing * new
+
+    def observe(self, key, days, rows, seconds):
+
+        """ observe
+
+        Records the outcome of a call covering `days` days that returned `rows` rows in `seconds` seconds.
+
+        INPUTS
+
+        @key [tuple]: Stats key, as built by `stats_key`.
+
+        @days [int]: Number of days the call covered.
+
+        @rows [int]: Number of rows returned.
+
+        @seconds [float]: Time the HTTP request took, or None if unknown.
+
+        """
+
+        with self._lock:
+
+            rows_per_day, seconds_per_row = self._stats.get(key, (None, None))
+
+            rows_per_day = self._blend(rows_per_day, rows / days)
+
+            if rows and seconds is not None:
+                seconds_per_row = self._blend(seconds_per_row, seconds / rows)
+
+            self._stats[key] = [rows_per_day, seconds_per_row]
+
+            ceiling = self._ceilings.get(key)
+
+            if ceiling is not None and days >= ceiling[0]:
+
+                ceiling[1] += 1
+
+                if ceiling[1] >= self.ceiling_recovery:
+                    self._ceilings[key] = [ceiling[0] + 1, 0]
+
+        return
+
+    def observe_timeout(self, key, days):
+
+        """ observe_timeout
+
+        Records that a call covering `days` days timed out. Later windows for the key are capped below that length,
+        and start at half of it.
+
+        INPUTS
+
+        @key [tuple]: Stats key, as built by `stats_key`.
+
+        @days [int]: Number of days the call covered.
+
+        """
+
+        with self._lock:
+
+            rows_per_day, seconds_per_row = self._stats.get(key, (None, None))
+
+            # Pretend a window of half the length would have hit the row target exactly.
+            implied_rows_per_day = self.target_rows / max(days / 2, self.min_days)
+
+            self._stats[key] = [max(rows_per_day or 0, implied_rows_per_day), seconds_per_row]
+
+            ceiling = self._ceilings.get(key)
+            limit = max(self.min_days, days - 1)
+
+            if ceiling is None or limit < ceiling[0]:
+                self._ceilings[key] = [limit, 0]
+
+        return
+
+    def window_days(self, key):
+
+        """ window_days
+
+        Chooses the window length for the next call with the given key.
+
+        INPUTS
+
+        @key [tuple]: Stats key, as built by `stats_key`.
+
+
+        RETURNS
+
+        @days [int]: Window length in days.
+
+        """
+
+        with self._lock:
+            rows_per_day, seconds_per_row = self._stats.get(key, (None, None))
+            ceiling = self._ceilings.get(key)
+
+        if rows_per_day is None:
+            days = self.initial_days
+
+        elif rows_per_day == 0:
+            days = self.max_days
+
+        else:
+            days = self.target_rows / rows_per_day
+
+            if self.target_seconds and seconds_per_row:
+                days = min(days, self.target_seconds / (seconds_per_row * rows_per_day))
+
+        if ceiling is not None:
+            days = min(days, ceiling[0])
+
+        return int(max(self.min_days, min(self.max_days, days)))
+
+    def fetch(self, api, method, from_datetime, to_datetime, **params):
+
+        """ fetch
+
+        Fetches a date range in adaptively sized windows, yielding each window's response as it arrives.
+
+        INPUTS
+
+        @api [MBTAPerformanceAPI]: The API instance used to make the calls. Give it a `timeout` so slow windows are
+            cut short and retried smaller.
+
+        @method [str]: The MBTAPerformanceAPI method name, e.g. 'get_travel_events'.
+
+        @from_datetime [str]: a string in YYYY-MM-DD format denoting the beginning of the time interval to search for.
+
+        @to_datetime [str]: a string in YYYY-MM-DD format denoting the end of the time interval to search for.
+
+        @params [kwargs]: Any other keyword arguments accepted by the method, such as `stop` or `route`.
+
+
+        RETURNS
+
+        @responses [generator of MBTAPerformanceResponse]: One response per window, in date order.
+
+        """
+
+        import requests  # Imported on first network use to keep `import mbta` fast.
+
+        key = self.stats_key(method, params)
+
+        # Service date ranges include their last day, epoch ranges end at midnight starting their last day.
+        inclusive = method in mbta.batch.SERVICE_DATE_METHODS
+
+        start = mbta.utils.date_string_to_datetime(from_datetime)
+        end = mbta.utils.date_string_to_datetime(to_datetime) + dt.timedelta(days=int(inclusive))
+
+        days = self.window_days(key)
+
+        while start < end:
+
+            window_end = min(start + dt.timedelta(days=days), end)
+            window_days = (window_end - start).days
+
+            call_to = window_end - dt.timedelta(days=int(inclusive))
+
+            try:
+                response = getattr(api, method)(from_datetime=start.strftime('%Y-%m-%d'),
+                                                to_datetime=call_to.strftime('%Y-%m-%d'), **params)
+
+            except requests.exceptions.Timeout:
+
+                if window_days <= self.min_days:
+                    raise
+
+                self.observe_timeout(key, window_days)
+                days = max(self.min_days, window_days // 2)
+
+                continue
+
+            # Only the HTTP time is learned; time spent queued for a scheduler slot says nothing about payload cost.
+            self.observe(key, window_days, len(response), mbta.utils.last_call_seconds())
+
+            yield response
+
+            start = window_end
+            days = self.window_days(key)
@@ -0,0 +1,100 @@
+"""
+filename: scripts/check_import_time.py
+author: Jared Stufft, jared@stufft.us
+desc: Fails if importing the package takes longer than its budget under `python -X importtime`, or if an import
+pulls in a dependency that should only be loaded on first network use. Run from the repository root.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+
+# In module : cumulative import budget in microseconds format
+IMPORT_BUDGETS_US = {
+    'mbta': 10000,
+    'mbta.performance': 60000
+}
+
+# Modules that must not be loaded until an API call is made.
+DEFERRED_MODULES = ('requests', 'zipfile', 'concurrent.futures', 'logging')
+
+
+def measure_import(module, repo_root):
+
+    """ measure_import
+
+    Imports a module in a fresh interpreter with `-X importtime`.
+
+    INPUTS
+
+    @module [str]: Dotted module name to import.
+
+    @repo_root [str]: Directory holding the mbta package.
+
+
+    RETURNS
+
+    @cumulative_us [int]: Cumulative import time of the module in microseconds.
+
+    @loaded [set]: Names of all modules imported along the way.
+
+    """
+
+    env = {**os.environ, 'PYTHONPATH': repo_root}
+
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)],
+                            env=env, stderr=subprocess.PIPE, universal_newlines=True, check=True)
+
+    cumulative_us, loaded = None, set()
+
+    for line in result.stderr.splitlines():
+
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+
+        _, cumulative, name = line[len('import time:'):].split('|')
+
+        if not cumulative.strip().isdigit():  # Header line.
+            continue
+
+        loaded.add(name.strip())
+
+        if name.strip() == module:
+            cumulative_us = int(cumulative)
+
+    return cumulative_us, loaded
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier applied to every budget, for slow hosts.')
+    args = parser.parse_args()
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    failures = []
+
+    for module, budget_us in sorted(IMPORT_BUDGETS_US.items()):
+
+        cumulative_us, loaded = measure_import(module, repo_root)
+        budget_us = int(budget_us * args.scale)
+
+        print('{}: {} us (budget {} us)'.format(module, cumulative_us, budget_us))
+
+        if cumulative_us is None or cumulative_us > budget_us:
+            failures.append('{} took {} us, over its {} us budget'.format(module, cumulative_us, budget_us))
+
+        for deferred in DEFERRED_MODULES:
+            if deferred in loaded:
+                failures.append('{} imported {} eagerly'.format(module, deferred))
+
+    for failure in failures:
+        print('FAIL: ' + failure)
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())